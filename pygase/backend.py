@@ -13,15 +13,16 @@ Provides the `Server` class and all PyGaSe components that deal with progression
 
 import time
 import threading
+import socket as std_socket
 
 import curio
 from curio import socket
 from curio.meta import awaitable
 
-from pygase.connection import ServerConnection
+from pygase.connection import ServerConnection, SHUT_ME_DOWN_COMMAND
 from pygase.gamestate import GameState, GameStateUpdate, GameStatus
 from pygase.event import UniversalEventHandler, Event
-from pygase.utils import logger
+from pygase.utils import Sqn, RingQueue, logger
 
 
 class GameStateStore:
@@ -37,6 +38,7 @@ class GameStateStore:
     """
 
     _update_cache_size: int = 100
+    _merged_update_cache_size: int = 16  # maximum number of distinct time orders to cache merged updates for
 
     def __init__(self, initial_game_state: GameState = None):
         logger.debug("Creating GameStateStore instance.")
@@ -45,11 +47,111 @@ class GameStateStore:
             raise TypeError(
                 f"'initial_game_state' should be of type 'GameState', not '{self._game_state.__class__.__name__}'."
             )
-        self._game_state_update_cache = [GameStateUpdate(0)]
+        # The update cache is a ring buffer of fixed size, `self._update_cache_write_index` counts all updates
+        # ever written to it and points (modulo the cache size) to the slot of the oldest cached update.
+        self._game_state_update_cache: list = [None] * self._update_cache_size
+        self._update_cache_write_index: int = 0
+        # The game loop may push updates from another thread while the server reads the cache.
+        self._update_cache_lock = threading.Lock()
+        self._cache_update(GameStateUpdate(0))
+        # Merged updates and their serializations per client time order, valid until the next update is pushed.
+        self._merged_updates: dict = {}
+
+    def _cache_update(self, update: GameStateUpdate) -> None:
+        """Overwrite the oldest entry of the update cache."""
+        with self._update_cache_lock:
+            self._game_state_update_cache[self._update_cache_write_index % self._update_cache_size] = update
+            self._update_cache_write_index += 1
 
     def get_update_cache(self) -> list:
-        """Return the latest state updates."""
-        return self._game_state_update_cache.copy()
+        """Return a consistent snapshot of the latest state updates, from oldest to newest."""
+        with self._update_cache_lock:
+            write_index = self._update_cache_write_index
+            if write_index < self._update_cache_size:
+                return self._game_state_update_cache[:write_index]
+            oldest = write_index % self._update_cache_size
+            return self._game_state_update_cache[oldest:] + self._game_state_update_cache[:oldest]
+
+    def iter_updates_newer_than(self, time_order: int):
+        """Iterate over the cached state updates that are more recent than a given time order.
+
+        # Arguments
+        time_order (int): time order the updates have to exceed
+
+        # Returns
+        generator: yields the matching updates from oldest to newest
+
+        ---
+        The matching updates are copied out of the cache at once, so updates pushed during the iteration
+        are not included. Updates are expected to be pushed in order of increasing time order, so the first
+        matching update can be found by a binary search over the cache.
+
+        """
+        time_order = Sqn(time_order)
+        cache = self._game_state_update_cache
+        cache_size = self._update_cache_size
+        with self._update_cache_lock:
+            write_index = self._update_cache_write_index
+            # Find the oldest cached update that is newer than `time_order`.
+            low, high = max(write_index - cache_size, 0), write_index
+            while low < high:
+                middle = (low + high) // 2
+                if cache[middle % cache_size].time_order > time_order:
+                    high = middle
+                else:
+                    low = middle + 1
+            start, end = low % cache_size, write_index % cache_size
+            if low == write_index:
+                newer_updates = []
+            elif start < end:
+                newer_updates = cache[start:end]
+            else:
+                newer_updates = cache[start:] + cache[:end]
+        yield from newer_updates
+
+    def get_update_since(self, time_order: int) -> GameStateUpdate:
+        """Return the sum of all cached state updates that are more recent than a given time order.
+
+        The result is cached until the next update is pushed, so all clients at the same time order
+        share one merged update. It must therefore not be modified.
+
+        # Arguments
+        time_order (int): the time order up to which the state is already known
+
+        """
+        return self._get_merged_update_entry(Sqn(time_order))[0]
+
+    def get_packed_update_since(self, time_order: int) -> tuple:
+        """Return the sum of all cached state updates that are more recent than a given time order, and its bytepack.
+
+        Like #GameStateStore.get_update_since, the result is cached until the next update is pushed,
+        so the merged update is serialized only once for all clients at the same time order.
+
+        # Arguments
+        time_order (int): the time order up to which the state is already known
+
+        # Returns
+        tuple: `(update, bytepack)` with `bytepack` being `update` serialized via its `to_bytes` method
+
+        """
+        entry = self._get_merged_update_entry(Sqn(time_order))
+        if entry[1] is None:
+            entry[1] = entry[0].to_bytes()
+        return (entry[0], entry[1])
+
+    def _get_merged_update_entry(self, time_order: Sqn) -> list:
+        """Return the cached `[update, bytepack]` entry for a time order, merging the update if necessary."""
+        merged_updates = self._merged_updates
+        entry = merged_updates.get(time_order)
+        if entry is None:
+            update = GameStateUpdate(time_order)
+            for newer_update in self.iter_updates_newer_than(time_order):
+                update += newer_update
+            # The bytepack is only created once a client actually needs it.
+            entry = [update, None]
+            if len(merged_updates) < self._merged_update_cache_size:
+                merged_updates[time_order] = entry
+        return entry
 
     def get_game_state(self) -> GameState:
         """Return the current game state."""
@@ -62,9 +164,8 @@ class GameStateStore:
         usually a #GameStateMachine.
 
         """
-        self._game_state_update_cache.append(update)
-        if len(self._game_state_update_cache) > self._update_cache_size:
-            del self._game_state_update_cache[0]
+        self._cache_update(update)
+        self._merged_updates = {}
         if update > self._game_state:
             logger.debug(
                 (
@@ -170,13 +271,15 @@ class Server:
         This method can also be spawned as a coroutine.
 
         """
-        curio.run(self.shutdown)
+        # No need to start a curio kernel just to send a single datagram.
+        with std_socket.socket(std_socket.AF_INET, std_socket.SOCK_DGRAM) as sock:
+            sock.sendto(SHUT_ME_DOWN_COMMAND, (self._hostname, self._port))
 
     @awaitable(shutdown)
     async def shutdown(self) -> None:  # pylint: disable=function-redefined
         # pylint: disable=missing-docstring
         async with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            await sock.sendto("shut_me_down".encode("utf-8"), (self._hostname, self._port))
+            await sock.sendto(SHUT_ME_DOWN_COMMAND, (self._hostname, self._port))
 
     # advanced type checking for target client and callback would be helpful
     def dispatch_event(
@@ -197,11 +300,6 @@ class Server:
         """
         event = Event(event_type, *args, **kwargs)
 
-        def get_ack_callback(connection):
-            if ack_callback is not None:
-                return lambda: ack_callback(connection)
-            return None
-
         timeout_callback = None
         if retries > 0:
 
@@ -216,12 +314,21 @@ class Server:
                 f"Event of type {event_type} timed out. Retrying to send event to server."
             )
 
+        # The keyword arguments are part of the event data, the connections only take the event and its callbacks.
         if target_client == "all":
-            for connection in self.connections.values():
-                connection.dispatch_event(event, get_ack_callback(connection), timeout_callback, **kwargs)
+            # All connections share the same event instance, so it is serialized only once for the broadcast.
+            if ack_callback is None:
+                for connection in self.connections.values():
+                    connection.dispatch_event(event, None, timeout_callback)
+            else:
+                for connection in self.connections.values():
+                    connection.dispatch_event(
+                        event, lambda connection=connection: ack_callback(connection), timeout_callback
+                    )
         else:
-            self.connections[target_client].dispatch_event(
-                event, get_ack_callback(self.connections[target_client]), timeout_callback, **kwargs
+            connection = self.connections[target_client]
+            connection.dispatch_event(
+                event, None if ack_callback is None else lambda: ack_callback(connection), timeout_callback
             )
 
     # add advanced type checking for handler functions
@@ -249,16 +356,24 @@ class GameStateMachine:
 
     # Attributes
     game_time (float): duration the game has been running in seconds
+    high_precision_tick (bool): if `True`, the game loop busy-waits for the last moments of each interval
+        to keep time steps accurate below the resolution of the OS scheduler, at the cost of keeping a CPU core busy
+        (default is `False`, which means the game loop just sleeps between time steps)
 
     """
 
+    high_precision_tick: bool = False
+    _busy_wait_time: float = 0.0002  # duration in seconds of the busy-wait at the end of each interval
+
     def __init__(self, game_state_store: GameStateStore):
         logger.debug("Creating GameStateMachine instance.")
         self.game_time: float = 0.0
-        self._event_queue = curio.UniversalQueue()
+        self._event_queue = RingQueue()
         self._universal_event_handler = UniversalEventHandler()
         self._game_state_store = game_state_store
         self._game_loop_is_running = False
+        # Set by #GameStateMachine.stop() so that the game loop doesn't have to check the game status every tick.
+        self._stop_requested = False
 
     def _push_event(self, event: Event) -> None:
         """Push an event into the state machines event queue.
@@ -267,12 +382,12 @@ class GameStateMachine:
 
         """
         logger.debug(f"State machine receiving event of type {event.type} via event wire.")
-        self._event_queue.put(event)
+        self._event_queue.push(event)
 
     @awaitable(_push_event)
     async def _push_event(self, event: Event) -> None:  # pylint: disable=function-redefined
         logger.debug(f"State machine receiving event of type {event.type} via event wire.")
-        await self._event_queue.put(event)
+        self._event_queue.push(event)
 
     # advanced type checking for the handler function would be helpful
     def register_event_handler(self, event_type: str, event_handler_function) -> None:
@@ -322,37 +437,49 @@ class GameStateMachine:
             )
         game_state = self._game_state_store.get_game_state()
         dt = interval
+        active_status = GameStatus.get("Active")
+        self._stop_requested = False
         self._game_loop_is_running = True
         logger.info(f"State machine starting game loop with interval of {interval} seconds.")
-        while game_state.game_status == GameStatus.get("Active"):
-            t0 = time.perf_counter()
-
-            update_dict = self.time_step(game_state, dt)
-            while not self._event_queue.empty():
-                event = await self._event_queue.get()
-                event_update = await self._universal_event_handler.handle(event, game_state=game_state, dt=dt)
-                update_dict.update(event_update)
-                if time.perf_counter() - t0 > 0.95 * interval:
+        try:
+            while not self._stop_requested:
+                t0 = time.perf_counter()
+
+                update_dict = self.time_step(game_state, dt)
+                # Events that don't get handled within the interval stay queued for the next time step.
+                for event in self._event_queue.drain():
+                    event_update = await self._universal_event_handler.handle(event, game_state=game_state, dt=dt)
+                    update_dict.update(event_update)
+                    if time.perf_counter() - t0 > 0.95 * interval:
+                        break
+
+                self._game_state_store.push_update(GameStateUpdate(game_state.time_order + 1, **update_dict))
+                game_state = self._game_state_store.get_game_state()
+                # The game may also be paused by the game logic or by updates pushed from elsewhere.
+                if game_state.game_status != active_status:
                     break
 
-            self._game_state_store.push_update(GameStateUpdate(game_state.time_order + 1, **update_dict))
-            game_state = self._game_state_store.get_game_state()
-
-            # real elapsed time since the loop start
-            real_elapsed_time = time.perf_counter() - t0
-
-            # consume the remaining time to reach the interval
-            delta = interval - real_elapsed_time
-            while delta > 0.0000001:
+                # sleep for the remaining time to reach the interval
                 delta = interval - (time.perf_counter() - t0)
-
-            # adding the real spent time to the game time
-            dt = interval - delta
-            self.game_time += dt
-            logger.info(f"loop time: {round(dt, 4)} vs expected {round(interval, 4)} => delta {round(dt - interval, 6)}")
-
-        logger.info("Game loop stopped.")
-        self._game_loop_is_running = False
+                if self.high_precision_tick:
+                    if delta > self._busy_wait_time:
+                        await curio.sleep(delta - self._busy_wait_time)
+                    while time.perf_counter() - t0 < interval:
+                        pass
+                else:
+                    await curio.sleep(max(delta, 0))
+
+                # adding the real spent time to the game time
+                dt = time.perf_counter() - t0
+                self.game_time += dt
+                logger.info(
+                    f"loop time: {round(dt, 4)} vs expected {round(interval, 4)} => delta {round(dt - interval, 6)}"
+                )
+        finally:
+            # Also clean up if the game loop task gets cancelled.
+            self._pause_game_state()
+            logger.info("Game loop stopped.")
+            self._game_loop_is_running = False
 
     def run_game_loop_in_thread(self, interval: float = 0.02) -> threading.Thread:
         """Simulate the game in a seperate thread.
@@ -381,24 +508,40 @@ class GameStateMachine:
         bool: wether or not the simulation was successfully stopped
 
         """
-        return curio.run(self.stop, timeout)
+        self._request_stop()
+        t0 = time.time()
+        while self._game_loop_is_running:
+            if time.time() - t0 > timeout:
+                break
+            time.sleep(timeout / 100)
+        return not self._game_loop_is_running
 
     @awaitable(stop)
     async def stop(self, timeout: float = 1.0) -> bool:  # pylint: disable=function-redefined
         # pylint: disable=missing-docstring
+        self._request_stop()
+        t0 = time.time()
+        while self._game_loop_is_running:
+            if time.time() - t0 > timeout:
+                break
+            await curio.sleep(0)
+        return not self._game_loop_is_running
+
+    def _request_stop(self) -> None:
+        """Signal the game loop to stop, or pause the game state right away if the loop isn't running."""
         logger.info("Trying to stop game loop ...")
+        self._stop_requested = True
+        if not self._game_loop_is_running:
+            self._pause_game_state()
+
+    def _pause_game_state(self) -> None:
+        """Set the game status to `GameStatus.get('Paused')` unless it already is."""
         if self._game_state_store.get_game_state().game_status == GameStatus.get("Active"):
             self._game_state_store.push_update(
                 GameStateUpdate(
                     self._game_state_store.get_game_state().time_order + 1, game_status=GameStatus.get("Paused")
                 )
             )
-        t0 = time.time()
-        while self._game_loop_is_running:
-            if time.time() - t0 > timeout:
-                break
-            await curio.sleep(0)
-        return not self._game_loop_is_running
 
     def time_step(self, game_state: GameState, dt: float) -> dict:
         """Calculate a game state update.
@@ -461,17 +604,41 @@ class Backend:
     def run(self, hostname: str, port: int, interval: float = 0.02):
         """Run state machine and server and bind the server to a given address.
 
+        Game loop and server run as tasks of the same curio kernel in a single thread.
+        This is a blocking function but can also be spawned as a coroutine.
+
         # Arguments
         hostname (str): hostname or IPv4 address the server will be bound to
         port (int): port number the server will be bound to
         interval (float): (minimum) duration in seconds between consecutive time steps
 
         """
-        self.game_state_machine.run_game_loop_in_thread(interval=interval)
-        self.server.run(port, hostname, self.game_state_machine)
-        self.game_state_machine.stop()
+        curio.run(self.run, hostname, port, interval)
+
+    @awaitable(run)
+    async def run(self, hostname: str, port: int, interval: float = 0.02):  # pylint: disable=function-redefined
+        # pylint: disable=missing-docstring
+        game_loop_task = await curio.spawn(self.game_state_machine.run_game_loop, interval)
+        # mypy only sees the sync signatures of these `awaitable` methods, but in a coroutine they are async.
+        try:
+            await self.server.run(port, hostname, self.game_state_machine)  # type: ignore
+        except BaseException:
+            # The server failed (e.g. because the port is already in use), possibly before the game loop started.
+            await game_loop_task.cancel()
+            raise
+        await self.game_state_machine.stop()  # type: ignore
+        await game_loop_task.join()
         logger.info("Backend successfully shut down.")
 
     def shutdown(self):
-        """Shut down server and stop game loop."""
+        """Shut down server and stop game loop.
+
+        This method can also be spawned as a coroutine.
+
+        """
         self.server.shutdown()
+
+    @awaitable(shutdown)
+    async def shutdown(self):  # pylint: disable=function-redefined
+        # pylint: disable=missing-docstring
+        await self.server.shutdown()
@@ -5,6 +5,8 @@ This module is not supposed to be required by users of this library.
 
 # Contents
 - #PROTOCOL_ID: 4 byte identifier for the PyGaSe package protocol
+- #SHUTDOWN_COMMAND: datagram with which a host client shuts down the server
+- #SHUT_ME_DOWN_COMMAND: datagram with which a server is shut down from its own machine
 - #ProtocolIDMismatchError: exception for receiving non-PyGaSe packages
 - #DuplicateSequenceError: exception for duplicate packages
 - #Header: class for PyGaSe package headers
@@ -19,17 +21,25 @@ This module is not supposed to be required by users of this library.
 """
 
 import time
+import struct
 
 import curio
 from curio import socket
 from curio.meta import awaitable, iscoroutinefunction
 
-from pygase.utils import NamedEnum, Sqn, LockedRessource, Comparable, logger
+from pygase.utils import NamedEnum, Sqn, LockedRessource, RingQueue, Comparable, logger
 from pygase.event import Event
 from pygase.gamestate import GameState, GameStateUpdate
 
 PROTOCOL_ID: bytes = bytes.fromhex("ffd0fab9")  # unique 4 byte identifier for pygase packages
 
+# Control datagrams are sent as raw bytes outside of the PyGaSe protocol, so they never need to be serialized.
+SHUTDOWN_COMMAND: bytes = b"shutdown"
+SHUT_ME_DOWN_COMMAND: bytes = b"shut_me_down"
+
+# Protocol ID, sequence, ack and ack bitfield make up the 12 byte package header.
+_HEADER_STRUCT = struct.Struct(">4sHHI")
+
 
 class ProtocolIDMismatchError(ValueError):
     """Bytestring could not be identified as a valid PyGaSe package."""
@@ -61,18 +71,22 @@ class Header(Comparable):
 
     """
 
+    # A header is created for every package that is sent or received, so it comes without an instance `__dict__`.
+    __slots__ = ("sequence", "ack", "ack_bitfield")
+
     def __init__(self, sequence: int, ack: int, ack_bitfield: str):
         self.sequence = Sqn(sequence)
         self.ack = Sqn(ack)
         self.ack_bitfield = ack_bitfield
 
+    def __eq__(self, other) -> bool:
+        if isinstance(other, self.__class__):
+            return self.destructure() == other.destructure()
+        return False
+
     def to_bytearray(self) -> bytearray:
         """Return 12 bytes representing the header."""
-        result = bytearray(PROTOCOL_ID)
-        result.extend(self.sequence.to_sqn_bytes())
-        result.extend(self.ack.to_sqn_bytes())
-        result.extend(int(self.ack_bitfield, 2).to_bytes(4, "big"))
-        return result
+        return bytearray(_HEADER_STRUCT.pack(PROTOCOL_ID, self.sequence, self.ack, int(self.ack_bitfield, 2)))
 
     def destructure(self) -> tuple:
         """Return the tuple `(sequence, ack, ack_bitfield)`."""
@@ -89,13 +103,11 @@ class Header(Comparable):
         tuple: `(header, payload)` with `payload` being a bytestring of the rest of the datagram
 
         """
-        if datagram[:4] != PROTOCOL_ID:
+        if datagram[:4] != PROTOCOL_ID or len(datagram) < _HEADER_STRUCT.size:
             raise ProtocolIDMismatchError
-        sequence = Sqn.from_sqn_bytes(datagram[4:6])
-        ack = Sqn.from_sqn_bytes(datagram[6:8])
-        ack_bitfield = bin(int.from_bytes(datagram[8:12], "big"))[2:].zfill(32)
-        payload = datagram[12:]
-        return (cls(sequence, ack, ack_bitfield), payload)
+        _, sequence, ack, ack_bitfield = _HEADER_STRUCT.unpack_from(datagram)
+        payload = datagram[_HEADER_STRUCT.size :]
+        return (cls(sequence, ack, format(ack_bitfield, "032b")), payload)
 
 
 class Package(Comparable):
@@ -169,20 +181,18 @@ class Package(Comparable):
             return self._datagram
         datagram = self.header.to_bytearray()
         # The header makes up the first 12 bytes of the package
-        datagram.extend(self._create_event_block())
-        datagram = datagram
+        self._write_event_block(datagram)
         if len(datagram) > self._max_size:
             raise OverflowError("Package exceeds the maximum size of " + str(self._max_size) + " bytes.")
         self._datagram = bytes(datagram)
         return self._datagram
 
-    def _create_event_block(self) -> bytearray:
-        event_block = bytearray()
+    def _write_event_block(self, datagram: bytearray) -> None:
+        """Append the length-prefixed events to `datagram` in place."""
         for event in self._events:
             bytepack = event.to_bytes()
-            event_block.extend(len(bytepack).to_bytes(2, "big"))
-            event_block.extend(bytepack)
-        return event_block
+            datagram.extend(len(bytepack).to_bytes(2, "big"))
+            datagram.extend(bytepack)
 
     @classmethod
     def from_datagram(cls, datagram: bytes) -> "Package":
@@ -205,12 +215,15 @@ class Package(Comparable):
         return result
 
     @staticmethod
-    def _read_out_event_block(event_block: bytes) -> list:
+    def _read_out_event_block(payload: bytes, offset: int = 0) -> list:
+        """Deserialize the events in `payload`, with the event block starting at `offset`."""
         events = []
-        while event_block:
-            bytesize = int.from_bytes(event_block[:2], "big")
-            events.append(Event.from_bytes(event_block[2 : bytesize + 2]))
-            event_block = event_block[bytesize + 2 :]
+        payload_size = len(payload)
+        while offset < payload_size:
+            bytesize = int.from_bytes(payload[offset : offset + 2], "big")
+            offset += 2
+            events.append(Event.from_bytes(payload[offset : offset + bytesize]))
+            offset += bytesize
         return events
 
 
@@ -237,8 +250,7 @@ class ClientPackage(Package):
         datagram = self.header.to_bytearray()
         # The header makes up the first 12 bytes of the package
         datagram.extend(self.time_order.to_sqn_bytes())
-        datagram.extend(self._create_event_block())
-        datagram = datagram
+        self._write_event_block(datagram)
         if len(datagram) > self._max_size:
             raise OverflowError("Package exceeds the maximum size of " + str(self._max_size) + " bytes.")
         self._datagram = bytes(datagram)
@@ -249,8 +261,7 @@ class ClientPackage(Package):
         """Override #Package.from_datagram to include `time_order`."""
         header, payload = Header.deconstruct_datagram(datagram)
         time_order = Sqn.from_sqn_bytes(payload[:2])
-        payload = payload[2:]
-        events = cls._read_out_event_block(payload)
+        events = cls._read_out_event_block(payload, 2)
         result = cls(header, time_order, events)
         result._datagram = datagram  # pylint: disable=protected-access
         return result
@@ -262,12 +273,29 @@ class ServerPackage(Package):
 
     # Arguments
     game_state_update (pygase.gamestate.GameStateUpdate): the servers most recent minimal update for the client
+    game_state_update_bytepack (bytes): `game_state_update` already serialized via its `to_bytes` method
 
     """
 
-    def __init__(self, header: Header, game_state_update: GameStateUpdate, events: list = None):
+    def __init__(
+        self,
+        header: Header,
+        game_state_update: GameStateUpdate,
+        events: list = None,
+        game_state_update_bytepack: bytes = None,
+    ):
         super().__init__(header, events)
         self.game_state_update = game_state_update
+        self._game_state_update_bytepack = game_state_update_bytepack
+
+    def __eq__(self, other) -> bool:
+        # The bytepack is only a serialization shortcut, so it doesn't take part in the comparison.
+        if isinstance(other, self.__class__):
+            ignored = "_game_state_update_bytepack"
+            return {key: value for key, value in self.__dict__.items() if key != ignored} == {
+                key: value for key, value in other.__dict__.items() if key != ignored
+            }
+        return False
 
     def to_datagram(self) -> bytes:
         """Override #Package.to_datagram to include `game_state_update`."""
@@ -275,11 +303,12 @@ class ServerPackage(Package):
             return self._datagram
         datagram = self.header.to_bytearray()
         # The header makes up the first 12 bytes of the package
-        state_update_bytepack = self.game_state_update.to_bytes()
+        state_update_bytepack = self._game_state_update_bytepack
+        if state_update_bytepack is None:
+            state_update_bytepack = self.game_state_update.to_bytes()
         datagram.extend(len(state_update_bytepack).to_bytes(2, "big"))
         datagram.extend(state_update_bytepack)
-        datagram.extend(self._create_event_block())
-        datagram = datagram
+        self._write_event_block(datagram)
         if len(datagram) > self._max_size:
             raise OverflowError("package exceeds the maximum size of " + str(self._max_size) + " bytes")
         self._datagram = bytes(datagram)
@@ -291,8 +320,7 @@ class ServerPackage(Package):
         header, payload = Header.deconstruct_datagram(datagram)
         state_update_bytesize = int.from_bytes(payload[:2], "big")
         game_state_update = GameStateUpdate.from_bytes(payload[2 : state_update_bytesize + 2])
-        payload = payload[state_update_bytesize + 2 :]
-        events = cls._read_out_event_block(payload)
+        events = cls._read_out_event_block(payload, state_update_bytesize + 2)
         result = cls(header, game_state_update, events)
         result._datagram = datagram  # pylint: disable=protected-access
         return result
@@ -369,7 +397,7 @@ class Connection:
         self.status = ConnectionStatus.get("Disconnected")
         self.quality = "good"  # this is used for congestion avoidance
         self._package_interval = self._package_intervals["good"]
-        self._outgoing_event_queue = curio.UniversalQueue()
+        self._outgoing_event_queue = RingQueue()
         self._incoming_event_queue = curio.UniversalQueue()
         self._pending_acks: dict = {}
         self._event_callback_sequence = Sqn(0)
@@ -471,7 +499,7 @@ class Connection:
             self._event_callback_sequence += 1
             callback_sequence = self._event_callback_sequence
             self._event_callbacks[self._event_callback_sequence] = {"ack": ack_callback, "timeout": timeout_callback}
-        self._outgoing_event_queue.put((event, callback_sequence))
+        self._outgoing_event_queue.push((event, callback_sequence))
         logger.debug(f"Dispatched event of type {event.type} to be sent to {self.remote_address}.")
 
     async def _handle_next_event(self):
@@ -540,8 +568,7 @@ class Connection:
         """
         self.local_sequence += 1
         package = self._create_next_package()
-        while len(package.events) < 5 and not self._outgoing_event_queue.empty():
-            event, callback_sequence = await self._outgoing_event_queue.get()
+        for event, callback_sequence in self._outgoing_event_queue.drain(5):
             if callback_sequence != 0:
                 if self.local_sequence not in self._events_with_callbacks:
                     self._events_with_callbacks[self.local_sequence] = [callback_sequence]
@@ -554,7 +581,6 @@ class Connection:
                 )
             )
             package.add_event(event)
-            await self._outgoing_event_queue.task_done()
         await sock.sendto(package.to_datagram(), self.remote_address)
         logger.debug(f"Sent package with sequence number {package.header.sequence} to {self.remote_address}.")
         self._pending_acks[package.header.sequence] = time.time()
@@ -658,15 +684,19 @@ class ClientConnection(Connection):
             (only has an effect if the client has host permissions)
 
         """
-        curio.run(self.shutdown, shutdown_server)
+        # The command queue is a `curio.UniversalQueue`, which can be used without a curio kernel.
+        self._command_queue.put("shutdown" if shutdown_server else "shut_me_down")
+        logger.debug(
+            (
+                f"Dispatched shutdown command with shutdown_server={shutdown_server} "
+                f"for connection to {self.remote_address}."
+            )
+        )
 
     @awaitable(shutdown)
     async def shutdown(self, shutdown_server: bool = False):  # pylint: disable=function-redefined
         # pylint: disable=missing-docstring
-        if shutdown_server:
-            await self._command_queue.put("shutdown")
-        else:
-            await self._command_queue.put("shut_me_down")
+        await self._command_queue.put("shutdown" if shutdown_server else "shut_me_down")
         logger.debug(
             (
                 f"Dispatched shutdown command with shutdown_server={shutdown_server} "
@@ -702,7 +732,7 @@ class ClientConnection(Connection):
                 command = await self._command_queue.get()
                 if command == "shutdown":
                     logger.info(f"Sending shutdown command to server at {self.remote_address}.")
-                    await sock.sendto("shutdown".encode("utf-8"), self.remote_address)
+                    await sock.sendto(SHUTDOWN_COMMAND, self.remote_address)
                     break
                 elif command == "shut_me_down":
                     break
@@ -754,7 +784,7 @@ class ServerConnection(Connection):
 
     # Arguments
     game_state_store (pygase.GameStateStore): object that serves as an interface to the game state repository
-        (has to provide the methods `get_gamestate`, `get_update_cache` and `push_update`)
+        (has to provide the methods `get_game_state`, `get_packed_update_since` and `push_update`)
     last_client_time_order (pygase.utils.Sqn): the last time order number known to the client
 
     # Attributes
@@ -772,23 +802,26 @@ class ServerConnection(Connection):
 
     def _create_next_package(self):
         """Override #Connection._create_next_package to include game state updates."""
-        update_cache = self.game_state_store.get_update_cache()
         # Respond by sending the sum of all updates since the client's time-order point.
         # Or the whole game state if the client doesn't have it yet.
         if self.last_client_time_order == 0:
             logger.debug(f"Sending full game state to client {self.remote_address}.")
             game_state = self.game_state_store.get_game_state()
             update = GameStateUpdate(**game_state.__dict__)
+            bytepack = None
         else:
-            update_base = GameStateUpdate(self.last_client_time_order)
-            update = sum((upd for upd in update_cache if upd > update_base), update_base)
+            update, bytepack = self.game_state_store.get_packed_update_since(self.last_client_time_order)
             logger.debug(
                 (
                     f"Sending update from time order {self.last_client_time_order} "
                     f"to {update.time_order} to client {self.remote_address}."
                 )
             )
-        return ServerPackage(Header(self.local_sequence, self.remote_sequence, self.ack_bitfield), update)
+        return ServerPackage(
+            Header(self.local_sequence, self.remote_sequence, self.ack_bitfield),
+            update,
+            game_state_update_bytepack=bytepack,
+        )
 
     async def _recv(self, package: ClientPackage):
         """Extend #Connection._recv to update `self.last_client_time_order`."""
@@ -852,15 +885,12 @@ class ServerConnection(Connection):
                     await server.connections[client_address]._recv(package)  # pylint: disable=protected-access
                 except ProtocolIDMismatchError:
                     # ignore all non-PyGaSe packages
-                    try:
-                        if data.decode("utf-8") == "shutdown" and client_address == server.host_client:
-                            logger.info(f"Received shutdown command from host client {client_address}.")
-                            break
-                        elif data.decode("utf-8") == "shut_me_down":
-                            break
-                        else:
-                            logger.warning("Received unknown package.")
-                    except UnicodeDecodeError:
+                    if data == SHUTDOWN_COMMAND and client_address == server.host_client:
+                        logger.info(f"Received shutdown command from host client {client_address}.")
+                        break
+                    elif data == SHUT_ME_DOWN_COMMAND:
+                        break
+                    else:
                         logger.warning("Received unknown package.")
             logger.info(f"Shutting down server on {(hostname, port)}.")
             await connection_tasks.cancel_remaining()
@@ -30,13 +30,49 @@ class Event(Sendable):
     handler_args (list):
     handler_kwargs (dict):
 
+    ---
+    An event is serialized only once, no matter how many packages it is sent with,
+    so it should not be modified after it has been dispatched.
+
     """
 
+    # Events have a fixed set of attributes, so they don't need an instance `__dict__`.
+    # `_bytepack` stores the serialized event and is neither sent nor compared.
+    __slots__ = ("type", "handler_args", "handler_kwargs", "_bytepack")
+    _bytepack: bytes
+
     def __init__(self, event_type: str, *args, **kwargs):
         self.type: str = event_type
         self.handler_args: list = list(args)
         self.handler_kwargs: dict = kwargs
 
+    def __eq__(self, other) -> bool:
+        if isinstance(other, self.__class__):
+            return self._get_attributes() == other._get_attributes()
+        return False
+
+    def _get_attributes(self) -> dict:
+        """Override `Sendable._get_attributes` for the slots of `Event`."""
+        return {"type": self.type, "handler_args": self.handler_args, "handler_kwargs": self.handler_kwargs}
+
+    def _set_attributes(self, attributes: dict) -> None:
+        """Override `Sendable._set_attributes` for the slots of `Event`."""
+        self.type = attributes["type"]
+        self.handler_args = attributes["handler_args"]
+        self.handler_kwargs = attributes["handler_kwargs"]
+
+    def to_bytes(self) -> bytes:
+        """Extend `Sendable.to_bytes` to serialize the event only once.
+
+        This way an event that is broadcast to all clients is packed once instead of once per connection.
+
+        """
+        try:
+            return self._bytepack
+        except AttributeError:
+            self._bytepack = super().to_bytes()  # pylint: disable=attribute-defined-outside-init
+            return self._bytepack
+
 
 class UniversalEventHandler:
 
@@ -113,6 +113,22 @@ class GameStateUpdate(Sendable):
         _recursive_update(other.__dict__, self.__dict__)
         return other
 
+    def __iadd__(self, other: "GameStateUpdate") -> "GameStateUpdate":
+        """Merge another update into this one in place.
+
+        Values and time order of the more recent update take precedence. Unlike `+`, this never modifies `other`
+        and copies its nested dicts, so updates can be safely accumulated from a cache of shared updates.
+
+        """
+        if other > self:
+            _recursive_update(self.__dict__, other.__dict__, copy_dicts=True)
+        else:
+            merged: dict = {}
+            _recursive_update(merged, other.__dict__, copy_dicts=True)
+            _recursive_update(merged, self.__dict__)
+            self.__dict__ = merged
+        return self
+
     def __radd__(self, other):
         """Update a `GameState`."""
         if isinstance(other, int):
@@ -132,12 +148,19 @@ class GameStateUpdate(Sendable):
         return self.time_order > other.time_order
 
 
-def _recursive_update(my_dict: dict, update_dict: dict, delete: bool = False) -> None:
-    """Update nested dicts deeply via recursion."""
+def _recursive_update(my_dict: dict, update_dict: dict, delete: bool = False, copy_dicts: bool = False) -> None:
+    """Update nested dicts deeply via recursion.
+
+    With `copy_dicts`, nested dicts of `update_dict` are copied into `my_dict` instead of being referenced.
+
+    """
     for key, value in update_dict.items():
-        if value == TO_DELETE and delete and key in my_dict.keys():
+        if delete and value == TO_DELETE and key in my_dict:
             del my_dict[key]
-        elif isinstance(value, dict) and key in my_dict.keys() and isinstance(my_dict[key], dict):
-            _recursive_update(my_dict[key], value, delete=delete)
+        elif isinstance(value, dict) and isinstance(my_dict.get(key), dict):
+            _recursive_update(my_dict[key], value, delete=delete, copy_dicts=copy_dicts)
+        elif copy_dicts and isinstance(value, dict):
+            my_dict[key] = {}
+            _recursive_update(my_dict[key], value, delete=delete, copy_dicts=True)
         else:
             my_dict[key] = value
@@ -9,6 +9,7 @@ Provides utilities used in PyGaSe code or helpful to users of this library.
 - #NamedEnum: base class for lists of strings to be mapped to integer values
 - #Sqn: subclass of `int` for sequence numbers that always fit in 2 bytes
 - #LockedRessource: class that attaches a `threading.Lock` to a ressource
+- #RingQueue: class for a FIFO queue with many producer threads and a single consumer
 - #get_available_ip_addresses: function that returns a list of local network interfaces
 
 """
@@ -19,13 +20,48 @@ from threading import Lock
 import umsgpack
 import ifaddr
 
+try:
+    # The C implementation of msgpack is much faster and produces the exact same bytestrings as umsgpack.
+    import msgpack
+except ImportError:
+    msgpack = None
+else:
+    # `unpackb` only accepts the `strict_map_key` argument since msgpack 0.6.1.
+    if msgpack.version < (0, 6, 1):
+        msgpack = None
+
 logger = logging.getLogger("PyGaSe")
 
 
+if msgpack is not None:
+
+    def _packb(obj) -> bytes:
+        return msgpack.packb(obj, use_single_float=True, use_bin_type=True)
+
+    def _unpackb(bytepack: bytes):
+        try:
+            return msgpack.unpackb(bytepack, raw=False, strict_map_key=False)
+        except TypeError:
+            # msgpack decodes array map keys as unhashable lists, umsgpack restores them as tuples.
+            return umsgpack.unpackb(bytepack)
+
+    _UNPACK_ERRORS: tuple = (ValueError, KeyError, TypeError, umsgpack.UnpackException)
+
+else:
+
+    def _packb(obj) -> bytes:
+        return umsgpack.packb(obj, force_float_precision="single")
+
+    _unpackb = umsgpack.unpackb
+    _UNPACK_ERRORS = (umsgpack.InsufficientDataException, KeyError, TypeError)
+
+
 class Comparable:
 
     """Compare objects by equality of attributes."""
 
+    __slots__ = ()
+
     def __eq__(self, other) -> bool:
         if isinstance(other, self.__class__):
             return self.__dict__ == other.__dict__
@@ -44,11 +80,28 @@ class Sendable(Comparable):
     Sendables can only have attributes of type `str`, `bytes`, `Sqn`, `int`, `float`, `bool`
     as well as `list`s or `tuple`s of such.
 
+    If the `msgpack` package is installed its C extension is used for serialization,
+    otherwise the pure Python `umsgpack` implementation.
+
+    Subclasses that declare `__slots__` instead of an instance `__dict__` have to override
+    `_get_attributes` and `_set_attributes`.
+
     """
 
+    __slots__ = ()
+
     def to_bytes(self) -> bytes:
         """Serialize the object to a compact bytestring."""
-        return umsgpack.packb(self.__dict__, force_float_precision="single")
+        return _packb(self._get_attributes())
+
+    def _get_attributes(self) -> dict:
+        """Return the attributes that make up the serialized object."""
+        return self.__dict__
+
+    def _set_attributes(self, attributes: dict) -> None:
+        """Restore the object from its deserialized attributes."""
+        # Only subclasses without `__slots__` get here, and those do have an instance `__dict__`.
+        self.__dict__ = attributes  # type: ignore # pylint: disable=attribute-defined-outside-init
 
     @classmethod
     def from_bytes(cls, bytepack: bytes):
@@ -63,9 +116,9 @@ class Sendable(Comparable):
         """
         try:
             received_sendable = object.__new__(cls)
-            received_sendable.__dict__ = umsgpack.unpackb(bytepack)  # pylint: disable=attribute-defined-outside-init
+            received_sendable._set_attributes(_unpackb(bytepack))  # pylint: disable=protected-access
             return received_sendable
-        except (umsgpack.InsufficientDataException, KeyError, TypeError):
+        except _UNPACK_ERRORS:
             raise TypeError("Bytes could no be parsed into " + cls.__name__ + ".")
 
 
@@ -291,6 +344,81 @@ class LockedRessource:
         logger.debug(f"Released lock for {self.ressource}.")
 
 
+class RingQueue:
+
+    """Queue items from many threads and consume them from a single one.
+
+    The items are stored in a preallocated ring buffer, indexed by two ever-increasing counters:
+    the head counter is advanced by producers, which serialize on a `threading.Lock`, and the tail counter
+    is only ever advanced by the single consumer, which therefore needs no lock at all.
+    Neither pushing nor consuming items moves any of the other items in memory.
+
+    If the buffer is full, its capacity is doubled.
+
+    # Arguments
+    capacity (int): number of items the buffer can hold before it has to grow
+
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._buffer: list = [None] * capacity
+        self._head: int = 0  # number of items pushed so far
+        self._tail: int = 0  # number of items consumed so far
+        self._lock: Lock = Lock()
+
+    def __len__(self) -> int:
+        return self._head - self._tail
+
+    def empty(self) -> bool:
+        """Return `True` if there are no items in the queue."""
+        return self._head == self._tail
+
+    def push(self, item) -> None:
+        """Add an item to the end of the queue.
+
+        This method is thread-safe.
+
+        """
+        with self._lock:
+            if self._head - self._tail == len(self._buffer):
+                self._grow()
+            buffer = self._buffer
+            buffer[self._head % len(buffer)] = item
+            self._head += 1
+
+    def _grow(self) -> None:
+        """Double the buffer capacity, keeping every item at a buffer index consistent with its counter."""
+        old_buffer = self._buffer
+        new_buffer = [None] * (2 * len(old_buffer))
+        for index in range(self._tail, self._head):
+            new_buffer[index % len(new_buffer)] = old_buffer[index % len(old_buffer)]
+        self._buffer = new_buffer
+
+    def drain(self, max_items: int = None):
+        """Consume items from the front of the queue.
+
+        Only a single thread may consume items. Items are removed from the queue one by one as the
+        returned generator is iterated, so stopping the iteration early will leave the remaining items queued.
+
+        # Arguments
+        max_items (int): the maximum number of items to consume, default is all of them
+
+        # Returns
+        generator: yields the consumed items in the order they were pushed
+
+        """
+        consumed = 0
+        while self._tail < self._head and (max_items is None or consumed < max_items):
+            # The buffer has to be read after the head counter, in case a producer just replaced it.
+            buffer = self._buffer
+            index = self._tail % len(buffer)
+            item = buffer[index]
+            buffer[index] = None
+            self._tail += 1
+            consumed += 1
+            yield item
+
+
 def get_available_ip_addresses() -> list:
     """Return a list of all locally available IPv4 addresses."""
     addresses = []
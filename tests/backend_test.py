@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import socket
+import sys
+import threading
+import time
+
 import curio
-from freezegun import freeze_time
 import pytest
 
 from helpers import assert_timeout
@@ -9,7 +13,8 @@ from helpers import assert_timeout
 from pygase.backend import Server, GameStateStore, GameStateMachine, Backend
 from pygase.gamestate import GameState, GameStateUpdate, GameStatus
 from pygase.connection import ClientPackage
-from pygase.event import UniversalEventHandler
+from pygase.event import UniversalEventHandler, Event
+from pygase.utils import Sqn
 
 
 class TestServer:
@@ -30,6 +35,16 @@ class TestServer:
 
         assert curio.run(test_task)
 
+    def test_shutdown_from_other_thread(self):
+        server = Server(GameStateStore())
+        thread = threading.Thread(target=server.run, args=[1235])
+        thread.start()
+        time.sleep(0.1)
+        assert thread.is_alive()
+        server.shutdown()
+        thread.join(timeout=1)
+        assert not thread.is_alive()
+
     def test_dispatch_event(self):
         server = Server(GameStateStore())
 
@@ -59,17 +74,36 @@ class TestServer:
         assert len(MockConnection.called_with) == 6
         assert MockConnection.called_with[-1][0][2] is None
 
+    def test_dispatch_event_with_kwargs(self):
+        server = Server(GameStateStore())
+
+        class MockConnection:
+            def __init__(self):
+                self.called_with = []
+
+            def dispatch_event(self, event, ack_callback=None, timeout_callback=None):
+                self.called_with.append((event, ack_callback, timeout_callback))
+
+        server.connections[("foo", 1)] = MockConnection()
+        server.connections[("bar", 1)] = MockConnection()
+        server.dispatch_event("BIZBAZ", foo="bar", ack_callback=id)
+        for connection in server.connections.values():
+            event, ack_callback, timeout_callback = connection.called_with[-1]
+            assert event.handler_kwargs == {"foo": "bar"}
+            assert ack_callback() == id(connection)
+            assert timeout_callback is None
+
 
 class TestGameStateStore:
     def test_instantiation(self):
         store = GameStateStore()
         assert store._game_state == GameState()
-        assert store._game_state_update_cache == [GameStateUpdate(0)]
+        assert store.get_update_cache() == [GameStateUpdate(0)]
 
     def test_push_update(self):
         store = GameStateStore()
         store.push_update(GameStateUpdate(1, test="foobar"))
-        assert len(store._game_state_update_cache) == 2
+        assert len(store.get_update_cache()) == 2
         assert store.get_game_state().time_order == 1
         assert store.get_game_state().test == "foobar"
 
@@ -86,9 +120,44 @@ class TestGameStateStore:
         for update in store.get_update_cache():
             counter += 1
             if update.time_order == 0:
-                del store._game_state_update_cache[2]
+                store.push_update(GameStateUpdate(4))
         assert counter == 3
-        assert len(store.get_update_cache()) == 2
+        assert len(store.get_update_cache()) == 4
+
+    def test_iteration_during_push(self):
+        store = GameStateStore()
+        for i in range(1, store._update_cache_size + 1):
+            store.push_update(GameStateUpdate(i))
+        updates = store.iter_updates_newer_than(0)
+        first_update = next(updates)
+        store.push_update(GameStateUpdate(store._update_cache_size + 1))
+        store.push_update(GameStateUpdate(store._update_cache_size + 2))
+        time_orders = [first_update.time_order] + [update.time_order for update in updates]
+        assert time_orders == list(range(1, store._update_cache_size + 1))
+
+    def test_threaded_push_and_merge(self):
+        store = GameStateStore()
+        pushed_updates = [GameStateUpdate(i, test=i) for i in range(1, 5001)]
+
+        def push_updates():
+            for update in pushed_updates:
+                store.push_update(update)
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            thread = threading.Thread(target=push_updates)
+            thread.start()
+            while thread.is_alive():
+                time_orders = [update.time_order for update in store.iter_updates_newer_than(0)]
+                assert time_orders == sorted(time_orders)
+                update = store.get_update_since(1)
+                assert update.time_order == getattr(update, "test", 1)
+            thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        assert all(update.time_order == update.test for update in pushed_updates)
+        assert [update.time_order for update in store.get_update_cache()] == list(range(4901, 5001))
 
     def test_cache_size(self):
         store = GameStateStore()
@@ -97,12 +166,61 @@ class TestGameStateStore:
             store.push_update(GameStateUpdate(i + 1))
             assert sum(store.get_update_cache()).time_order == i + 1
 
+    def test_iter_updates_newer_than(self):
+        store = GameStateStore()
+        for i in range(2 * store._update_cache_size):
+            store.push_update(GameStateUpdate(i + 1))
+        assert [update.time_order for update in store.get_update_cache()] == list(
+            range(store._update_cache_size + 1, 2 * store._update_cache_size + 1)
+        )
+        newer_updates = list(store.iter_updates_newer_than(2 * store._update_cache_size - 3))
+        assert [update.time_order for update in newer_updates] == [
+            2 * store._update_cache_size - 2,
+            2 * store._update_cache_size - 1,
+            2 * store._update_cache_size,
+        ]
+        assert list(store.iter_updates_newer_than(2 * store._update_cache_size)) == []
+
+    def test_iter_updates_newer_than_wrap_over(self):
+        store = GameStateStore()
+        time_order = Sqn(int(Sqn.get_max_sequence()) - store._update_cache_size // 2)
+        for _ in range(store._update_cache_size):
+            time_order += 1
+            store.push_update(GameStateUpdate(time_order))
+        newer_updates = list(store.iter_updates_newer_than(int(Sqn.get_max_sequence()) - 1))
+        assert [update.time_order for update in newer_updates[:3]] == [Sqn.get_max_sequence(), 1, 2]
+        assert newer_updates[-1].time_order == time_order
+
+    def test_get_update_since(self):
+        store = GameStateStore()
+        store.push_update(GameStateUpdate(1, foo="foo"))
+        store.push_update(GameStateUpdate(2, bar="bar"))
+        update = store.get_update_since(0)
+        assert update == GameStateUpdate(2, foo="foo", bar="bar")
+        assert store.get_update_since(0) is update
+        assert store.get_update_since(1) == GameStateUpdate(2, bar="bar")
+        assert store.get_update_since(2) == GameStateUpdate(2)
+        store.push_update(GameStateUpdate(3, foo="baz"))
+        assert store.get_update_since(0) is not update
+        assert store.get_update_since(0) == GameStateUpdate(3, foo="baz", bar="bar")
+
+    def test_get_packed_update_since(self):
+        store = GameStateStore()
+        store.push_update(GameStateUpdate(1, foo="foo"))
+        update, bytepack = store.get_packed_update_since(0)
+        assert update is store.get_update_since(0)
+        assert GameStateUpdate.from_bytes(bytepack) == update == GameStateUpdate(1, foo="foo")
+        assert store.get_packed_update_since(0)[1] is bytepack
+        store.push_update(GameStateUpdate(2, foo="bar"))
+        update, bytepack = store.get_packed_update_since(0)
+        assert GameStateUpdate.from_bytes(bytepack) == update == GameStateUpdate(2, foo="bar")
+
 
 class TestGameStateMachine:
     def test_instantiation(self):
         state_machine = GameStateMachine(GameStateStore())
         assert state_machine.game_time == 0
-        assert state_machine._game_state_store._game_state_update_cache == [GameStateUpdate(0)]
+        assert state_machine._game_state_store.get_update_cache() == [GameStateUpdate(0)]
 
     def test_abstractness(self):
         state_machine = GameStateMachine(GameStateStore())
@@ -119,20 +237,96 @@ class TestGameStateMachine:
         state_machine = MyStateMachine(store)
 
         async def test_task():
-            with freeze_time() as frozen_time:
-                game_loop = await curio.spawn(state_machine.run_game_loop, 1)
-                for _ in range(10):
-                    frozen_time.tick()
-                    await curio.sleep(0)
-                await state_machine.stop()
-                await game_loop.join()
+            game_loop = await curio.spawn(state_machine.run_game_loop, 0.01)
+            await assert_timeout(1, lambda: store.get_game_state().test >= 10)
+            await state_machine.stop()
+            await game_loop.join()
+            return True
+
+        assert curio.run(test_task)
+        time_steps = store.get_game_state().test
+        assert time_steps >= 10
+        assert store.get_game_state().time_order == time_steps + 2
+        assert state_machine.game_time >= time_steps * 0.01
+        assert store.get_game_state().game_status == GameStatus.get("Paused")
+
+    def test_game_loop_paused_by_time_step(self):
+        class MyStateMachine(GameStateMachine):
+            def time_step(self, game_state, dt):
+                if game_state.test == 3:
+                    return {"game_status": GameStatus.get("Paused")}
+                return {"test": game_state.test + 1}
+
+        store = GameStateStore(GameState(0, test=0))
+        state_machine = MyStateMachine(store)
+        curio.run(curio.timeout_after, 1, state_machine.run_game_loop, 0.01)
+        assert store.get_game_state().test == 3
+        assert store.get_game_state().game_status == GameStatus.get("Paused")
+        assert not state_machine._game_loop_is_running
+
+    def test_game_loop_paused_by_pushed_update(self):
+        class MyStateMachine(GameStateMachine):
+            def time_step(self, game_state, dt):
+                return {"test": game_state.test + 1}
+
+        store = GameStateStore(GameState(0, test=0))
+        state_machine = MyStateMachine(store)
+
+        async def test_task():
+            game_loop = await curio.spawn(state_machine.run_game_loop, 0.01)
+            await assert_timeout(1, lambda: store.get_game_state().test > 0)
+            time_order = store.get_game_state().time_order + 1
+            store.push_update(GameStateUpdate(time_order, game_status=GameStatus.get("Paused")))
+            await curio.timeout_after(1, game_loop.join)
             return True
 
         assert curio.run(test_task)
-        assert store.get_game_state().time_order == 12
-        assert store.get_game_state().test == 10
-        assert state_machine.game_time == 10
         assert store.get_game_state().game_status == GameStatus.get("Paused")
+        assert not state_machine._game_loop_is_running
+
+    def test_event_handling(self):
+        class MyStateMachine(GameStateMachine):
+            def time_step(self, game_state, dt):
+                return {}
+
+        store = GameStateStore(GameState(0))
+        state_machine = MyStateMachine(store)
+        state_machine.register_event_handler("SET", lambda i, game_state, dt: {f"item{i}": i})
+        for i in range(3):
+            state_machine._push_event(Event("SET", i))
+
+        async def test_task():
+            game_loop = await curio.spawn(state_machine.run_game_loop, 0.01)
+            await state_machine._push_event(Event("SET", 3))
+            await assert_timeout(1, lambda: hasattr(store.get_game_state(), "item3"))
+            await state_machine.stop()
+            await game_loop.join()
+            return True
+
+        assert curio.run(test_task)
+        assert [getattr(store.get_game_state(), f"item{i}") for i in range(4)] == [0, 1, 2, 3]
+        assert state_machine._event_queue.empty()
+
+    def test_high_precision_game_loop(self):
+        class MyStateMachine(GameStateMachine):
+            high_precision_tick = True
+
+            def time_step(self, game_state, dt):
+                return {"dts": game_state.dts + [dt]}
+
+        store = GameStateStore(GameState(0, dts=[]))
+        state_machine = MyStateMachine(store)
+
+        async def test_task():
+            game_loop = await curio.spawn(state_machine.run_game_loop, 0.01)
+            await assert_timeout(1, lambda: len(store.get_game_state().dts) >= 5)
+            await state_machine.stop()
+            await game_loop.join()
+            return True
+
+        assert curio.run(test_task)
+        # the first time step is passed the interval, all others the measured duration of the previous step
+        assert all(dt >= 0.01 for dt in store.get_game_state().dts)
 
 
 class TestBackend:
@@ -145,3 +339,39 @@ class TestBackend:
         assert backend.game_state_machine.time_step == time_step
         assert isinstance(backend.server, Server)
         assert backend.server.game_state_store == backend.game_state_store
+
+    def test_run_async(self):
+        time_step = lambda game_state, dt: {"counter": game_state.counter + 1}
+        backend = Backend(initial_game_state=GameState(counter=0), time_step_function=time_step)
+
+        async def test_task():
+            backend_task = await curio.spawn(backend.run, "localhost", 0, 0.01)
+            await assert_timeout(1, lambda: backend.server.port is not None)
+            await assert_timeout(1, lambda: backend.game_state_store.get_game_state().counter > 0)
+            await backend.shutdown()
+            await backend_task.join()
+            return True
+
+        assert curio.run(test_task)
+        assert backend.game_state_store.get_game_state().game_status == GameStatus.get("Paused")
+
+    def test_run_port_in_use(self):
+        blocking_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        blocking_socket.bind(("localhost", 0))
+        port = blocking_socket.getsockname()[1]
+        time_step = lambda game_state, dt: {}
+        backend = Backend(initial_game_state=GameState(), time_step_function=time_step)
+
+        async def test_task():
+            backend_task = await curio.spawn(backend.run, "localhost", port, 0.01)
+            with pytest.raises(curio.TaskError) as error:
+                await backend_task.join()
+            assert isinstance(error.value.__cause__, OSError)
+            return True
+
+        try:
+            assert curio.run(test_task)
+        finally:
+            blocking_socket.close()
+        assert not backend.game_state_machine._game_loop_is_running
+        assert backend.game_state_store.get_game_state().game_status == GameStatus.get("Paused")
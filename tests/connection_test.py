@@ -66,6 +66,20 @@ class TestServerPackage:
         unpacked_package = ServerPackage.from_datagram(datagram)
         assert package == unpacked_package
 
+    def test_bytepacking_multiple_events(self):
+        events = [Event("TEST", i, foo="bar" * i) for i in range(5)]
+        package = ServerPackage(Header(4, 5, "10" * 16), GameStateUpdate(2, test=1), events)
+        unpacked_package = ServerPackage.from_datagram(package.to_datagram())
+        assert unpacked_package.events == events
+        assert unpacked_package.game_state_update == package.game_state_update
+
+    def test_bytepacking_prepacked_update(self):
+        update = GameStateUpdate(2, test=1)
+        package = ServerPackage(Header(4, 5, "10" * 16), update, game_state_update_bytepack=update.to_bytes())
+        assert package == ServerPackage(Header(4, 5, "10" * 16), update)
+        assert package.to_datagram() == ServerPackage(Header(4, 5, "10" * 16), update).to_datagram()
+        assert ServerPackage.from_datagram(package.to_datagram()) == package
+
 
 class TestConnection:
     def test_recv_first_package(self):
@@ -12,6 +12,15 @@ class TestEvent:
         event2 = Event.from_bytes(event1.to_bytes())
         assert event1 == event2
 
+    def test_bytepack_reuse(self):
+        event = Event("TEST", 1, foo="bar")
+        bytepack = event.to_bytes()
+        assert event.to_bytes() is bytepack
+        assert not hasattr(event, "__dict__")
+        received_event = Event.from_bytes(bytepack)
+        assert received_event == event
+        assert received_event.to_bytes() == bytepack
+
     def test_synchronous_event_handler(self):
         handler = UniversalEventHandler()
         testlist = []
@@ -57,3 +57,22 @@ class TestGameStateUpdate:
             + update
         )
         assert game_state.time_order == 5 and game_state.test[1] == "test1"
+
+    def test_in_place_addition(self):
+        update = GameStateUpdate(time_order=1, test={1: "foo"}, foo="bar")
+        accumulated_update = update
+        newer_update = GameStateUpdate(time_order=2, test={2: "bar"}, nested={"foo": {"bar": 1}})
+        accumulated_update += newer_update
+        assert accumulated_update is update
+        assert update.time_order == 2 and update.test == {1: "foo", 2: "bar"} and update.foo == "bar"
+        older_update = GameStateUpdate(time_order=1, foo="baz", bar="foo", test={3: "baz"})
+        accumulated_update += older_update
+        assert accumulated_update is update
+        assert accumulated_update.time_order == 2
+        assert accumulated_update.foo == "bar" and accumulated_update.bar == "foo"
+        assert accumulated_update.test == {1: "foo", 2: "bar", 3: "baz"}
+        accumulated_update += GameStateUpdate(time_order=3, nested={"foo": {"baz": 2}})
+        # Neither update that was added is modified.
+        assert older_update == GameStateUpdate(time_order=1, foo="baz", bar="foo", test={3: "baz"})
+        assert newer_update == GameStateUpdate(time_order=2, test={2: "bar"}, nested={"foo": {"bar": 1}})
+        assert accumulated_update.nested == {"foo": {"bar": 1, "baz": 2}}
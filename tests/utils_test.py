@@ -1,5 +1,5 @@
 import pytest
-from pygase.utils import Sqn, Sendable, get_available_ip_addresses
+from pygase.utils import Sqn, Sendable, RingQueue, get_available_ip_addresses
 
 
 class TestSendable:
@@ -27,6 +27,14 @@ class TestSendable:
 
         assert SomeOtherClass() == SomeOtherClass.from_bytes(SomeOtherClass().to_bytes())
 
+    def test_bytepacking_tuple_keys(self):
+        class SomeClass(Sendable):
+            def __init__(self, players):
+                self.players = players
+
+        obj = SomeClass({("localhost", 1234): {"position": [1.0, 2.0]}, (1, (2, 3)): "foo"})
+        assert SomeClass.from_bytes(obj.to_bytes()) == obj
+
 
 class TestSqn:
     def test_initialize_valid_values(self):
@@ -127,6 +135,37 @@ class TestSqn:
         assert len(subSqn(12532).to_sqn_bytes()) == 4
 
 
+class TestRingQueue:
+    def test_push_and_drain(self):
+        queue = RingQueue(4)
+        assert queue.empty()
+        for i in range(3):
+            queue.push(i)
+        assert len(queue) == 3
+        assert list(queue.drain()) == [0, 1, 2]
+        assert queue.empty()
+
+    def test_bounded_drain(self):
+        queue = RingQueue(4)
+        for i in range(3):
+            queue.push(i)
+        assert list(queue.drain(2)) == [0, 1]
+        for item in queue.drain():
+            queue.push(item + 10)
+            break
+        assert list(queue.drain(5)) == [12]
+
+    def test_wrap_around_and_growth(self):
+        queue = RingQueue(4)
+        for i in range(3):
+            queue.push(i)
+        assert list(queue.drain(2)) == [0, 1]
+        for i in range(3, 10):
+            queue.push(i)
+        assert len(queue._buffer) == 8
+        assert list(queue.drain()) == list(range(2, 10))
+
+
 class TestUtilFunctions:
     def test_get_IpAddresses(self):
         ips = get_available_ip_addresses()